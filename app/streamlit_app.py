@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import os
+from functools import partial
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import streamlit as st
@@ -28,6 +30,16 @@ NPS_COLORS = {
 }
 
 
+CATEGORICAL_COLUMNS = (
+    "encounterclass",
+    "complaint_category",
+    "survey_response",
+    "nps_category",
+    "patient_id",
+    "clinician_id",
+)
+
+
 @st.cache_resource
 def get_engine():
     load_dotenv()
@@ -50,33 +62,61 @@ def get_engine():
         database=db,
         query={"sslmode": "require", "channel_binding": "require"},
     )
-    return create_engine(db_url)
+    return create_engine(
+        db_url,
+        pool_size=5,
+        max_overflow=10,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        connect_args={"options": "-c statement_timeout=30000"},
+    )
 
 
-@st.cache_data(ttl=300)
-def run_query(sql_text: str) -> pd.DataFrame:
-    with get_engine().connect() as conn:
-        return pd.read_sql_query(text(sql_text), conn)
+def run_query(sql_text: str, chunk_size: int = 50_000) -> pd.DataFrame:
+    with get_engine().connect().execution_options(stream_results=True) as conn:
+        chunks = pd.read_sql_query(text(sql_text), conn, chunksize=chunk_size)
+        return pd.concat(chunks, ignore_index=True)
+
 
+def prepare_indexed(frame: pd.DataFrame, date_col: str) -> pd.DataFrame:
+    return frame.sort_values(date_col, na_position="first", kind="stable", ignore_index=True)
 
-def load_data() -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+
+def slice_by_date(frame: pd.DataFrame, date_col: str, start_ts: pd.Timestamp, end_ts: pd.Timestamp) -> pd.DataFrame:
+    values = frame[date_col].to_numpy(dtype="datetime64[ns]").view("int64")
+    lo, hi = values.searchsorted([start_ts.value, end_ts.value])
+    return frame.iloc[lo:hi]
+
+
+@st.cache_data(ttl=300)
+def load_data() -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     consultations = run_query("SELECT * FROM digital_health.vw_consultation_clinical_records")
     ops = run_query("SELECT * FROM digital_health.vw_operations_monthly")
     feedback = run_query("SELECT * FROM digital_health.vw_feedback_comments")
+    consult_monthly = run_query("SELECT * FROM digital_health.vw_consultations_monthly_by_class")
+    feedback_monthly = run_query("SELECT * FROM digital_health.vw_feedback_monthly_summary")
 
     for frame, date_cols in [
         (consultations, ["consultation_start", "consultation_end"]),
         (ops, ["month"]),
         (feedback, ["consult_start"]),
+        (consult_monthly, ["month"]),
+        (feedback_monthly, ["month"]),
     ]:
         for col in date_cols:
             if col in frame.columns:
                 frame[col] = pd.to_datetime(frame[col], errors="coerce", utc=True).dt.tz_localize(None)
+        for col in CATEGORICAL_COLUMNS:
+            if col in frame.columns:
+                frame[col] = frame[col].astype("category")
 
-    return consultations, ops, feedback
+    consultations = prepare_indexed(consultations, "consultation_start")
+    feedback = prepare_indexed(feedback, "consult_start")
+    return consultations, ops, feedback, consult_monthly, feedback_monthly
 
 
-def color_map_from_classes(classes: list[str]) -> dict[str, str]:
+@st.cache_data
+def color_map_from_classes(classes: tuple[str, ...]) -> dict[str, str]:
     resolved: dict[str, str] = {}
     fallback = ["#17becf", "#bcbd22", "#8c564b", "#7f7f7f", "#e377c2"]
     fallback_index = 0
@@ -90,10 +130,15 @@ def color_map_from_classes(classes: list[str]) -> dict[str, str]:
     return resolved
 
 
+@st.cache_data(ttl=300, max_entries=1)
+def to_csv_bytes(frame: pd.DataFrame) -> bytes:
+    return frame.to_csv(index=False).encode("utf-8")
+
+
 def summarize_consultation_insight(monthly: pd.DataFrame) -> str:
     if monthly.empty:
         return "No consultation trend insight available for current filters."
-    total_by_month = monthly.groupby("month", as_index=False)["consultations"].sum().sort_values("month")
+    total_by_month = monthly.groupby("month", as_index=False)["consultations"].sum()
     if len(total_by_month) < 2:
         return "Insufficient month coverage to compute consultation change insight."
     delta = int(total_by_month.iloc[-1]["consultations"] - total_by_month.iloc[-2]["consultations"])
@@ -108,7 +153,10 @@ def summarize_ops_insight(ops: pd.DataFrame) -> str:
     latest_slice = ops[ops["month"] == latest_month]
     if latest_slice.empty:
         return "No operations insight available for current filters."
-    top_ref = latest_slice.sort_values("referral_rate_pct", ascending=False).iloc[0]
+    referral_rates = latest_slice["referral_rate_pct"].dropna()
+    if referral_rates.empty:
+        return "No operations insight available for current filters."
+    top_ref = latest_slice.loc[referral_rates.idxmax()]
     return (
         f"In the latest month ({latest_month.date()}), highest referral rate is in "
         f"{top_ref['encounterclass']} at {top_ref['referral_rate_pct']:.1f}% "
@@ -117,9 +165,10 @@ def summarize_ops_insight(ops: pd.DataFrame) -> str:
 
 
 def summarize_feedback_insight(summary: pd.DataFrame) -> str:
-    if summary.empty:
+    months = summary["month"].dropna()
+    if months.empty:
         return "No feedback insight available for current filters."
-    latest_row = summary.sort_values("month").iloc[-1]
+    latest_row = summary.loc[months.idxmax()]
     complaint_rate = (latest_row["complaints"] / latest_row["responses"] * 100.0) if latest_row["responses"] else 0
     return (
         f"Latest month average NPS is {latest_row['avg_nps']:.2f} with complaint rate "
@@ -127,15 +176,43 @@ def summarize_feedback_insight(summary: pd.DataFrame) -> str:
     )
 
 
+def count_distinct(values: pd.Series) -> int:
+    codes = values.cat.codes.to_numpy()
+    seen = np.bincount(codes[codes >= 0], minlength=len(values.cat.categories))
+    return int(np.count_nonzero(seen))
+
+
+def monthly_consultations(consultations: pd.DataFrame) -> pd.DataFrame:
+    month = consultations["consultation_start"].dt.to_period("M").dt.to_timestamp()
+    return (
+        consultations.groupby([month.rename("month"), "encounterclass"], dropna=False, observed=True)
+        .size()
+        .reset_index(name="consultations")
+    )
+
+
+def monthly_feedback(feedback: pd.DataFrame) -> pd.DataFrame:
+    month = feedback["consult_start"].dt.to_period("M").dt.to_timestamp()
+    return (
+        feedback.groupby([month.rename("month"), "encounterclass"], dropna=False, observed=True)
+        .agg(
+            responses=("consult_id", "count"),
+            nps_total=("nps_score", "sum"),
+            complaints=("complaint_flag", "sum"),
+        )
+        .reset_index()
+    )
+
+
 def show_overview(consultations: pd.DataFrame, feedback: pd.DataFrame) -> None:
     st.subheader("Overview KPIs")
 
     total_consults = len(consultations)
-    unique_patients = consultations["patient_id"].nunique()
-    unique_clinicians = consultations["clinician_id"].nunique()
-    referral_rate = consultations["referral_flag"].fillna(False).mean() * 100 if total_consults else 0
+    unique_patients = count_distinct(consultations["patient_id"])
+    unique_clinicians = count_distinct(consultations["clinician_id"])
+    referral_rate = consultations["referral_flag"].to_numpy(dtype=bool, na_value=False).mean() * 100 if total_consults else 0
     avg_nps = feedback["nps_score"].mean() if not feedback.empty else 0
-    complaint_rate = feedback["complaint_flag"].fillna(False).mean() * 100 if not feedback.empty else 0
+    complaint_rate = feedback["complaint_flag"].to_numpy(dtype=bool, na_value=False).mean() * 100 if not feedback.empty else 0
 
     cols = st.columns(6)
     cols[0].metric("Consultations", f"{total_consults:,}")
@@ -146,13 +223,13 @@ def show_overview(consultations: pd.DataFrame, feedback: pd.DataFrame) -> None:
     cols[5].metric("Complaint Rate", f"{complaint_rate:.1f}%")
 
 
-def show_consultation_tab(consultations: pd.DataFrame, class_color_map: dict[str, str]) -> None:
+def show_consultation_tab(
+    consultations: pd.DataFrame,
+    monthly: pd.DataFrame,
+    class_color_map: dict[str, str],
+) -> None:
     st.subheader("Consultation & Clinical Records")
 
-    trend = consultations.copy()
-    trend["month"] = trend["consultation_start"].dt.to_period("M").dt.to_timestamp()
-    monthly = trend.groupby(["month", "encounterclass"], dropna=False).size().reset_index(name="consultations")
-
     if monthly.empty:
         st.info("No consultation data found for selected filters.")
         return
@@ -185,16 +262,11 @@ def show_consultation_tab(consultations: pd.DataFrame, class_color_map: dict[str
         st.dataframe(consultations[display_cols], use_container_width=True, height=420)
 
 
-def show_feedback_tab(feedback: pd.DataFrame) -> None:
+def show_feedback_tab(feedback: pd.DataFrame, feedback_monthly: pd.DataFrame) -> None:
     st.subheader("Patient Satisfaction & Feedback")
 
-    monthly = feedback.copy()
-    monthly["month"] = monthly["consult_start"].dt.to_period("M").dt.to_timestamp()
-    summary = monthly.groupby("month", dropna=False).agg(
-        responses=("consult_id", "count"),
-        avg_nps=("nps_score", "mean"),
-        complaints=("complaint_flag", "sum"),
-    ).reset_index()
+    summary = feedback_monthly.groupby("month", dropna=False)[["responses", "nps_total", "complaints"]].sum().reset_index()
+    summary["avg_nps"] = summary["nps_total"] / summary["responses"]
 
     if summary.empty:
         st.info("No feedback data found for selected filters.")
@@ -224,44 +296,52 @@ def show_feedback_tab(feedback: pd.DataFrame) -> None:
 
     st.info(summarize_feedback_insight(summary))
 
-    cat = feedback.groupby("complaint_category", dropna=False).size().reset_index(name="count").sort_values("count", ascending=False)
+    cat = feedback.groupby("complaint_category", dropna=False, observed=True).size().reset_index(name="count").sort_values("count", ascending=False)
     cat_chart = px.bar(cat.head(10), x="complaint_category", y="count", title="Top complaint categories")
     st.plotly_chart(cat_chart, use_container_width=True)
 
     with st.expander("Show underlying feedback rows"):
-        st.dataframe(feedback, use_container_width=True, height=360)
+        display_cols = [
+            "consult_id",
+            "patient_id",
+            "clinician_id",
+            "consult_start",
+            "encounterclass",
+            "nps_score",
+            "nps_category",
+            "complaint_flag",
+            "complaint_category",
+        ]
+        st.dataframe(feedback[display_cols], use_container_width=True, height=360)
 
 
 def show_comments_tab(feedback: pd.DataFrame) -> None:
     st.subheader("Qualitative Comments Explorer")
 
+    categories = sorted(feedback["complaint_category"].dropna().unique().tolist())
     category_filter = st.multiselect(
         "Complaint category",
-        options=sorted(feedback["complaint_category"].dropna().unique().tolist()),
-        default=sorted(feedback["complaint_category"].dropna().unique().tolist())[:5],
+        options=categories,
+        default=categories[:5],
     )
 
-    working = feedback.copy()
+    working = feedback[
+        [
+            "consult_id",
+            "consult_start",
+            "encounterclass",
+            "nps_score",
+            "survey_response",
+            "complaint_category",
+            "qualitative_comment",
+        ]
+    ]
     if category_filter:
         working = working[working["complaint_category"].isin(category_filter)]
 
     st.info(f"Showing {len(working):,} comments for selected complaint categories.")
 
-    st.dataframe(
-        working[
-            [
-                "consult_id",
-                "consult_start",
-                "encounterclass",
-                "nps_score",
-                "survey_response",
-                "complaint_category",
-                "qualitative_comment",
-            ]
-        ],
-        use_container_width=True,
-        height=440,
-    )
+    st.dataframe(working, use_container_width=True, height=440)
 
 
 def main() -> None:
@@ -281,7 +361,7 @@ This dashboard helps answer four operational questions:
             """
         )
 
-    consultations, ops, feedback = load_data()
+    consultations, ops, feedback, consult_monthly, feedback_monthly = load_data()
 
     with st.sidebar:
         st.header("Global Filters")
@@ -307,20 +387,33 @@ This dashboard helps answer four operational questions:
         consultations = consultations[consultations["encounterclass"].isin(selected_classes)]
         ops = ops[ops["encounterclass"].isin(selected_classes)]
         feedback = feedback[feedback["encounterclass"].isin(selected_classes)]
+        consult_monthly = consult_monthly[consult_monthly["encounterclass"].isin(selected_classes)]
+        feedback_monthly = feedback_monthly[feedback_monthly["encounterclass"].isin(selected_classes)]
 
     if isinstance(date_range, tuple) and len(date_range) == 2 and date_range[0] and date_range[1]:
         start_ts = pd.Timestamp(date_range[0])
         end_ts = pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)
-        consultations = consultations[
-            (consultations["consultation_start"] >= start_ts)
-            & (consultations["consultation_start"] < end_ts)
-        ]
-        feedback = feedback[(feedback["consult_start"] >= start_ts) & (feedback["consult_start"] < end_ts)]
+        consultations = slice_by_date(consultations, "consultation_start", start_ts, end_ts)
+        feedback = slice_by_date(feedback, "consult_start", start_ts, end_ts)
         start_month = start_ts.to_period("M").to_timestamp()
         end_month = (end_ts - pd.Timedelta(days=1)).to_period("M").to_timestamp()
         ops = ops[(ops["month"] >= start_month) & (ops["month"] <= end_month)]
 
-    class_color_map = color_map_from_classes(classes)
+        covers_whole_months = (start_ts.is_month_start or start_ts <= min_date) and (
+            end_ts.is_month_start or end_ts > max_date
+        )
+        if covers_whole_months:
+            consult_monthly = consult_monthly[
+                (consult_monthly["month"] >= start_month) & (consult_monthly["month"] <= end_month)
+            ]
+            feedback_monthly = feedback_monthly[
+                (feedback_monthly["month"] >= start_month) & (feedback_monthly["month"] <= end_month)
+            ]
+        else:
+            consult_monthly = monthly_consultations(consultations)
+            feedback_monthly = monthly_feedback(feedback)
+
+    class_color_map = color_map_from_classes(tuple(classes))
 
     show_overview(consultations, feedback)
 
@@ -332,7 +425,7 @@ This dashboard helps answer four operational questions:
     ])
 
     with tab1:
-        show_consultation_tab(consultations, class_color_map)
+        show_consultation_tab(consultations, consult_monthly, class_color_map)
 
     with tab2:
         st.subheader("Operations Monitoring")
@@ -367,14 +460,14 @@ This dashboard helps answer four operational questions:
                 st.dataframe(ops, use_container_width=True, height=380)
 
     with tab3:
-        show_feedback_tab(feedback)
+        show_feedback_tab(feedback, feedback_monthly)
 
     with tab4:
         show_comments_tab(feedback)
 
     st.download_button(
         label="Download filtered consultation records",
-        data=consultations.to_csv(index=False).encode("utf-8"),
+        data=partial(to_csv_bytes, consultations),
         file_name="consultation_records_filtered.csv",
         mime="text/csv",
     )
@@ -1,14 +1,17 @@
 from __future__ import annotations
 
 import argparse
-import hashlib
+import io
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pyarrow.csv as pa_csv
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 
 
 CORE_FILES = {
@@ -38,36 +41,74 @@ NUMERIC_COLUMNS = {
     "conditions": [],
 }
 
+FLOAT32_COLUMNS = ("lat", "lon")
+
+CATEGORICAL_COLUMNS = ("encounterclass", "complaint_category", "survey_response", "nps_category")
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+_HEX_DIGITS = np.full(256, -1, dtype=np.int16)
+_HEX_DIGITS[np.frombuffer(b"0123456789abcdef", dtype=np.uint8)] = np.arange(16)
+_HEX_DIGITS[np.frombuffer(b"ABCDEF", dtype=np.uint8)] = np.arange(10, 16)
+
 
 def normalize_column_name(name: str) -> str:
-    value = name.strip().lower()
-    value = re.sub(r"[^a-z0-9]+", "_", value)
-    value = re.sub(r"_+", "_", value).strip("_")
-    return value
+    return _NON_ALNUM.sub("_", name.strip().lower()).strip("_")
 
 
 def clean_dataframe(df: pd.DataFrame, table_name: str) -> pd.DataFrame:
-    cleaned = df.copy()
-    cleaned.columns = [normalize_column_name(c) for c in cleaned.columns]
+    df.columns = [normalize_column_name(c) for c in df.columns]
 
     for col in DATETIME_COLUMNS[table_name]:
-        if col in cleaned.columns:
-            cleaned[col] = pd.to_datetime(cleaned[col], errors="coerce", utc=True)
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce", utc=True)
 
     for col in NUMERIC_COLUMNS[table_name]:
-        if col in cleaned.columns:
-            cleaned[col] = pd.to_numeric(cleaned[col], errors="coerce")
-
-    for col in cleaned.columns:
-        if cleaned[col].dtype == object:
-            cleaned[col] = cleaned[col].astype("string").str.strip()
+        if col in df.columns:
+            values = pd.to_numeric(df[col], errors="coerce")
+            if values.dtype.kind in "iu":
+                values = values.astype(np.int32)
+            elif col in FLOAT32_COLUMNS:
+                values = values.astype(np.float32)
+            df[col] = values
+
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].astype("string").str.strip()
+
+    return to_categorical(df)
+
+
+def to_categorical(df: pd.DataFrame) -> pd.DataFrame:
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def read_synthea_csv(file_path: Path) -> pd.DataFrame:
+    table = pa_csv.read_csv(
+        file_path,
+        convert_options=pa_csv.ConvertOptions(
+            strings_can_be_null=True,
+            timestamp_parsers=[pa_csv.ISO8601],
+        ),
+    )
+    return table.to_pandas(split_blocks=True, self_destruct=True, coerce_temporal_nanoseconds=True)
 
-    return cleaned
 
+def deterministic_nps(encounter_ids: pd.Series) -> np.ndarray:
+    ids = encounter_ids.fillna("").to_numpy(dtype=object)
+    code_points = ids.astype("U2").view(np.uint32).reshape(-1, 2)
+    digits = np.where(code_points < 256, _HEX_DIGITS[np.minimum(code_points, 255)], -1)
+    is_hex = (digits >= 0).all(axis=1)
 
-def deterministic_nps(encounter_id: str) -> int:
-    digest = hashlib.md5((encounter_id or "").encode("utf-8")).hexdigest()
-    return int(digest[:2], 16) % 11
+    scores = np.empty(len(ids), dtype=np.int8)
+    scores[is_hex] = (digits[is_hex, 0] * 16 + digits[is_hex, 1]) % 11
+    if not is_hex.all():
+        hashed = pd.util.hash_array(ids[~is_hex], categorize=False)
+        scores[~is_hex] = hashed % 11
+    return scores
 
 
 def generate_feedback(encounters: pd.DataFrame) -> pd.DataFrame:
@@ -88,20 +129,10 @@ def generate_feedback(encounters: pd.DataFrame) -> pd.DataFrame:
         (feedback["consult_stop"] - feedback["consult_start"]).dt.total_seconds() / 3600.0
     )
 
-    feedback["nps_score"] = feedback["consult_id"].fillna("").map(deterministic_nps)
-    feedback["nps_category"] = pd.cut(
-        feedback["nps_score"],
-        bins=[-1, 6, 8, 10],
-        labels=["Detractor", "Passive", "Promoter"],
-    ).astype("string")
-
-    feedback["survey_response"] = feedback["nps_category"].map(
-        {
-            "Detractor": "Dissatisfied",
-            "Passive": "Neutral",
-            "Promoter": "Satisfied",
-        }
-    )
+    feedback["nps_score"] = deterministic_nps(feedback["consult_id"])
+    nps_state = pd.cut(feedback["nps_score"], bins=[-1, 6, 8, 10], labels=False)
+    feedback["nps_category"] = pd.Categorical.from_codes(nps_state, categories=["Detractor", "Passive", "Promoter"])
+    feedback["survey_response"] = pd.Categorical.from_codes(nps_state, categories=["Dissatisfied", "Neutral", "Satisfied"])
 
     feedback["complaint_flag"] = (
         (feedback["nps_score"] <= 6)
@@ -116,34 +147,46 @@ def generate_feedback(encounters: pd.DataFrame) -> pd.DataFrame:
         "urgentcare": "Urgent care flow concern",
     }
 
-    feedback["complaint_category"] = feedback.apply(
-        lambda row: class_map.get((row.get("encounterclass") or "").lower(), "General complaint") if row["complaint_flag"] else "No complaint",
-        axis=1,
+    encounter_class = feedback["encounterclass"].astype("category")
+    class_labels = encounter_class.cat.categories.str.lower().map(class_map).fillna("General complaint")
+    category_lookup = np.array([*class_labels, "General complaint", "No complaint"], dtype=object)
+    class_state = encounter_class.cat.codes.to_numpy()
+    class_state = np.where(class_state < 0, len(class_labels), class_state)
+    feedback["complaint_category"] = category_lookup[
+        np.where(feedback["complaint_flag"].to_numpy(), class_state, len(class_labels) + 1)
+    ]
+
+    comment_lookup = np.array(
+        [
+            "I experienced delays and would like better follow-up.",
+            "Care was acceptable but there is room for improvement.",
+            "Service was efficient and communication was clear.",
+        ],
+        dtype=object,
     )
+    feedback["qualitative_comment"] = comment_lookup[nps_state]
+
+    return to_categorical(feedback)
 
-    feedback["qualitative_comment"] = feedback.apply(
-        lambda row: (
-            "Service was efficient and communication was clear."
-            if row["nps_category"] == "Promoter"
-            else "Care was acceptable but there is room for improvement."
-            if row["nps_category"] == "Passive"
-            else "I experienced delays and would like better follow-up."
-        ),
-        axis=1,
-    )
 
-    return feedback
+def load_table(file_path: Path, table_name: str) -> pd.DataFrame:
+    return clean_dataframe(read_synthea_csv(file_path), table_name)
 
 
 def load_core_tables(input_dir: Path) -> dict[str, pd.DataFrame]:
-    tables: dict[str, pd.DataFrame] = {}
+    file_paths: dict[str, Path] = {}
     for table_name, file_name in CORE_FILES.items():
         file_path = input_dir / file_name
         if not file_path.exists():
             raise FileNotFoundError(f"Missing required Synthea file: {file_path}")
-        raw = pd.read_csv(file_path)
-        tables[table_name] = clean_dataframe(raw, table_name)
-    return tables
+        file_paths[table_name] = file_path
+
+    with ThreadPoolExecutor(max_workers=len(file_paths)) as executor:
+        futures = {
+            table_name: executor.submit(load_table, file_path, table_name)
+            for table_name, file_path in file_paths.items()
+        }
+        return {table_name: future.result() for table_name, future in futures.items()}
 
 
 def export_processed(tables: dict[str, pd.DataFrame], feedback: pd.DataFrame, output_dir: Path) -> None:
@@ -170,15 +213,57 @@ def get_db_config() -> tuple[str, object]:
     return schema, engine
 
 
+def copy_frame(engine, frame: pd.DataFrame, schema: str, table_name: str, chunk_size: int = 100_000) -> None:
+    inspector = inspect(engine)
+    table_exists = inspector.has_table(table_name, schema=schema)
+    if table_exists:
+        existing = [c["name"] for c in inspector.get_columns(table_name, schema=schema)]
+        if existing != list(frame.columns):
+            raise ValueError(
+                f"Columns of existing table {schema}.{table_name} do not match the data being loaded. "
+                f"Drop the raw tables with CASCADE, re-run the ingest, then re-apply sql/01_views.sql."
+            )
+    else:
+        frame.head(0).to_sql(table_name, engine, schema=schema, index=False)
+
+    columns = ", ".join(f'"{c}"' for c in frame.columns)
+    copy_sql = f'COPY {schema}."{table_name}" ({columns}) FROM STDIN WITH (FORMAT csv)'
+
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cur:
+            if table_exists:
+                cur.execute(f'TRUNCATE TABLE {schema}."{table_name}"')
+            for start in range(0, len(frame), chunk_size):
+                buf = io.StringIO()
+                frame.iloc[start : start + chunk_size].to_csv(buf, index=False, header=False)
+                buf.seek(0)
+                cur.copy_expert(copy_sql, buf)
+        raw_conn.commit()
+    finally:
+        raw_conn.close()
+
+
 def write_to_database(tables: dict[str, pd.DataFrame], feedback: pd.DataFrame) -> None:
     schema, engine = get_db_config()
     with engine.begin() as conn:
         conn.exec_driver_sql(f"CREATE SCHEMA IF NOT EXISTS {schema};")
 
     for table_name, frame in tables.items():
-        frame.to_sql(f"raw_{table_name}", engine, schema=schema, if_exists="replace", index=False)
+        copy_frame(engine, frame, schema, f"raw_{table_name}")
+
+    copy_frame(engine, feedback, schema, "raw_patient_feedback")
+    refresh_materialized_views(engine, schema)
 
-    feedback.to_sql("raw_patient_feedback", engine, schema=schema, if_exists="replace", index=False)
+
+def refresh_materialized_views(engine, schema: str) -> None:
+    with engine.begin() as conn:
+        views = conn.exec_driver_sql(
+            "SELECT matviewname FROM pg_matviews WHERE schemaname = %(schema)s ORDER BY matviewname",
+            {"schema": schema},
+        ).scalars().all()
+        for view_name in views:
+            conn.exec_driver_sql(f'REFRESH MATERIALIZED VIEW {schema}."{view_name}"')
 
 
 def main() -> None:
@@ -90,3 +90,27 @@ SELECT
     complaint_category,
     qualitative_comment
 FROM digital_health.raw_patient_feedback;
+
+
+DROP MATERIALIZED VIEW IF EXISTS digital_health.vw_consultations_monthly_by_class;
+CREATE MATERIALIZED VIEW digital_health.vw_consultations_monthly_by_class AS
+SELECT
+    DATE_TRUNC('month', start AT TIME ZONE 'UTC')::date AS month,
+    encounterclass,
+    COUNT(*) AS consultations
+FROM digital_health.raw_encounters
+GROUP BY 1, 2
+ORDER BY 1, 2;
+
+
+DROP MATERIALIZED VIEW IF EXISTS digital_health.vw_feedback_monthly_summary;
+CREATE MATERIALIZED VIEW digital_health.vw_feedback_monthly_summary AS
+SELECT
+    DATE_TRUNC('month', consult_start AT TIME ZONE 'UTC')::date AS month,
+    encounterclass,
+    COUNT(consult_id) AS responses,
+    SUM(nps_score) AS nps_total,
+    SUM(CASE WHEN complaint_flag THEN 1 ELSE 0 END) AS complaints
+FROM digital_health.raw_patient_feedback
+GROUP BY 1, 2
+ORDER BY 1, 2;